@@ -0,0 +1,99 @@
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import visualize_warehouse as vw
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, 'visualize_warehouse.py')
+INST1 = os.path.join(HERE, 'simpleInstances', 'inst1.asp')
+PLAN1 = os.path.join(HERE, 'plan_inst1.json')
+
+
+def step_by_step(initial_state, actions_per_step):
+    state = initial_state
+    for actions_now in actions_per_step[1:]:
+        state = vw.update_state(state, actions_now)
+    return state
+
+
+def occurs(robot, action):
+    return {'robot': robot, 'action': vw.parse_action_string(action)}
+
+
+class SimulateMatchesUpdateState(unittest.TestCase):
+    """ simulate() (headless) must reach the same final state as the rendered update_state path. """
+
+    def setUp(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.state, _ = vw.parse_init(INST1)
+
+    def assertSameFinalState(self, actions_per_step):
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = step_by_step(self.state, actions_per_step)
+            actual = vw.simulate(self.state, actions_per_step)
+        self.assertEqual(actual, expected)
+
+    def test_inst1_plan(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan, max_time = vw.parse_plan(PLAN1)
+        self.assertSameFinalState([plan.get(t, ()) for t in range(max_time + 1)])
+
+    def test_actions_in_a_step_see_the_state_before_it(self):
+        # The deliver happens at the robot's pre-move cell, so it must be rejected
+        self.assertSameFinalState([
+            (),
+            [occurs('2', 'pickup')],
+            [occurs('2', 'move(1,-1)'), occurs('2', 'deliver(2,2,1)')],
+        ])
+
+    def test_random_plans(self):
+        actions = ['move(1,0)', 'move(-1,0)', 'move(0,1)', 'move(0,-1)', 'pickup', 'putdown',
+                   'deliver(1,1,1)', 'deliver(1,3,2)', 'deliver(2,2,1)', 'deliver(3,4,1)']
+        for seed in range(50):
+            rng = random.Random(seed)
+            actions_per_step = [()] + [
+                [occurs(rng.choice('12'), rng.choice(actions)) for _ in range(rng.randint(0, 3))]
+                for _ in range(30)
+            ]
+            with self.subTest(seed=seed):
+                self.assertSameFinalState(actions_per_step)
+
+
+class HeadlessVerdictMatchesRender(unittest.TestCase):
+    """ A piped run is headless by default; its verdict must match a rendered run's. """
+
+    def run_cli(self, plan_file, *flags):
+        result = subprocess.run([sys.executable, SCRIPT, INST1, plan_file, '--delay', '0', *flags],
+                                capture_output=True, text=True, check=True)
+        lines = re.sub(r'\x1b\[[0-9;]*[A-Za-z]', '', result.stdout).splitlines()
+        warnings = [line for line in lines if line.startswith('Warning:')]
+        verdict = lines[lines.index('Final Order Requirements:'):]
+        return warnings, verdict
+
+    def assertSameVerdict(self, plan_file):
+        self.assertEqual(self.run_cli(plan_file), self.run_cli(plan_file, '--render'))
+
+    def test_inst1_plan(self):
+        self.assertSameVerdict(PLAN1)
+
+    def test_plan_with_rejected_delivery(self):
+        atoms = ["occurs(object(robot,2),pickup,1)",
+                 "occurs(object(robot,2),move(1,-1),2)",
+                 "occurs(object(robot,2),deliver(2,2,1),2)"]
+        with tempfile.TemporaryDirectory() as tmp:
+            plan_file = os.path.join(tmp, 'plan.json')
+            with open(plan_file, 'w') as f:
+                json.dump({'Call': [{'Witnesses': [{'Value': atoms}]}]}, f)
+            self.assertSameVerdict(plan_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
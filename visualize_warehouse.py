@@ -2,9 +2,20 @@ import json
 import re
 import argparse
 from collections import defaultdict
-import copy
+import functools
 import time 
 import os
+import sys
+
+try:
+    import ijson  # Optional: streams the plan instead of loading the whole JSON document
+except ImportError:
+    ijson = None
+
+try:
+    import orjson  # Optional: faster loads when the whole plan document is parsed at once
+except ImportError:
+    orjson = None
 
 # --- Configuration ---
 GRID_SYMBOLS = {
@@ -22,9 +33,24 @@ CLEAR_SCREEN = '\033[2J'
 CURSOR_HOME = '\033[H'
 CURSOR_UP = '\033[F'
 CLEAR_LINE = '\033[K'
+CLEAR_TO_END = '\033[J'
 
 # --- Parsing Functions ---
 
+# Every init/2 fact starts with this prefix; the object kind that follows selects one pattern,
+# which is matched from the comma after the kind.
+_INIT_PREFIX = "init(object("
+_AT_RE = re.compile(r",\s*(?P<id>\w+)\),\s*value\(at,\s*pair\((?P<a>\d+),(?P<b>\d+)\)\)\)\.")
+_INIT_PATTERNS = {
+    'node': _AT_RE,
+    'highway': _AT_RE,
+    'pickingStation': _AT_RE,
+    'robot': _AT_RE,
+    'shelf': _AT_RE,
+    'product': re.compile(r",\s*(?P<id>\w+)\),\s*value\(on,\s*pair\((?P<a>\w+),(?P<b>\d+)\)\)\)\."),
+    'order': re.compile(r",\s*(?P<id>\w+)\),\s*value\((?:pickingStation,\s*(?P<sid>\w+)|line,\s*pair\((?P<a>\w+),(?P<b>\d+)\))\)\)\."),
+}
+
 def parse_init(filepath):
     """
     Parses the init facts from the input .lp file.
@@ -38,12 +64,59 @@ def parse_init(filepath):
         'shelves': {},          # id -> {'pos': (x, y), 'quantities': {product_id: qty}}
         'products': set(),      # set of all product_ids mentioned
         'orders': {},           # id -> {'station_id': sid, 'requirements': {product_id: qty}}
+        'shelf_at': {},         # (x, y) -> shelf id a pickup there takes (first on collisions)
+        'robots_at': {},        # (x, y) -> robot id
     }
-    max_x, max_y = 0, 0
-    shelf_quantities_temp = defaultdict(lambda: defaultdict(int))
-    order_reqs_temp = defaultdict(lambda: defaultdict(int)) 
+    # Plain inner dicts: a defaultdict leaking into the state would grow on every missed lookup
+    shelf_quantities_temp = defaultdict(dict)
+    order_reqs_temp = defaultdict(dict)
     order_station_temp = {} 
 
+    def add_node(m):
+        state['nodes'].add((int(m.group('a')), int(m.group('b'))))
+
+    def add_highway(m):
+        state['highways'].add((int(m.group('a')), int(m.group('b'))))
+
+    def add_station(m):
+        state['picking_stations'][m.group('id')] = (int(m.group('a')), int(m.group('b')))
+
+    def add_robot(m):
+        state['robots'][m.group('id')] = {'pos': (int(m.group('a')), int(m.group('b'))), 'carries': None}
+
+    def add_shelf(m):
+        shelf_id, pos = m.group('id'), (int(m.group('a')), int(m.group('b')))
+        if shelf_id not in state['shelves']:
+            state['shelves'][shelf_id] = {'pos': pos, 'quantities': {}}
+        else:
+            state['shelves'][shelf_id]['pos'] = pos
+
+    # Product ids key every shelf and order table; interning shares one string per id
+    def add_product(m):
+        product_id = sys.intern(m.group('id'))
+        state['products'].add(product_id)
+        shelf_quantities_temp[m.group('a')][product_id] = int(m.group('b'))
+
+    def add_order(m):
+        order_id = m.group('id')
+        if m.group('sid') is not None:
+            order_station_temp[order_id] = m.group('sid')
+        else:
+            product_id = sys.intern(m.group('a'))
+            state['products'].add(product_id)
+            order_reqs_temp[order_id][product_id] = int(m.group('b'))
+
+    handlers = {
+        'node': add_node,
+        'highway': add_highway,
+        'pickingStation': add_station,
+        'robot': add_robot,
+        'shelf': add_shelf,
+        'product': add_product,
+        'order': add_order,
+    }
+    prefix_len = len(_INIT_PREFIX)
+
     try:
         with open(filepath, 'r') as f:
             for line in f:
@@ -51,51 +124,20 @@ def parse_init(filepath):
                 if not line or line.startswith('%'):
                     continue
 
-                match_node = re.match(r"init\(object\(node,\s*(\w+)\),\s*value\(at,\s*pair\((\d+),(\d+)\)\)\)\.", line)
-                match_highway = re.match(r"init\(object\(highway,\s*(\w+)\),\s*value\(at,\s*pair\((\d+),(\d+)\)\)\)\.", line)
-                match_station = re.match(r"init\(object\(pickingStation,\s*(\w+)\),\s*value\(at,\s*pair\((\d+),(\d+)\)\)\)\.", line)
-                match_robot = re.match(r"init\(object\(robot,\s*(\w+)\),\s*value\(at,\s*pair\((\d+),(\d+)\)\)\)\.", line)
-                match_shelf_loc = re.match(r"init\(object\(shelf,\s*(\w+)\),\s*value\(at,\s*pair\((\d+),(\d+)\)\)\)\.", line)
-                match_product = re.match(r"init\(object\(product,\s*(\w+)\),\s*value\(on,\s*pair\((\w+),(\d+)\)\)\)\.", line)
-                match_order_station = re.match(r"init\(object\(order,\s*(\w+)\),\s*value\(pickingStation,\s*(\w+)\)\)\.", line)
-                match_order_line = re.match(r"init\(object\(order,\s*(\w+)\),\s*value\(line,\s*pair\((\w+),(\d+)\)\)\)\.", line)
-
-                if match_node:
-                    _, x, y = match_node.groups() # node_id often unused
-                    x, y = int(x), int(y)
-                    state['nodes'].add((x, y))
-                    max_x = max(max_x, x)
-                    max_y = max(max_y, y)
-                elif match_highway:
-                    _, x, y = match_highway.groups()
-                    state['highways'].add((int(x), int(y)))
-                elif match_station:
-                    station_id, x, y = match_station.groups()
-                    state['picking_stations'][station_id] = (int(x), int(y))
-                elif match_robot:
-                    robot_id, x, y = match_robot.groups()
-                    state['robots'][robot_id] = {'pos': (int(x), int(y)), 'carries': None}
-                elif match_shelf_loc:
-                    shelf_id, x, y = match_shelf_loc.groups()
-                    if shelf_id not in state['shelves']:
-                         state['shelves'][shelf_id] = {'pos': (int(x), int(y)), 'quantities': {}}
-                    else: 
-                         state['shelves'][shelf_id]['pos'] = (int(x), int(y)) 
-                elif match_product:
-                    product_id, shelf_id, qty = match_product.groups()
-                    state['products'].add(product_id)
-                    shelf_quantities_temp[shelf_id][product_id] = int(qty)
-                elif match_order_station:
-                    order_id, station_id = match_order_station.groups()
-                    order_station_temp[order_id] = station_id
-                elif match_order_line:
-                    order_id, product_id, qty = match_order_line.groups()
-                    state['products'].add(product_id)
-                    order_reqs_temp[order_id][product_id] = int(qty)
+                m = None
+                if line.startswith(_INIT_PREFIX):
+                    kind_end = line.find(',', prefix_len)
+                    kind = line[prefix_len:kind_end] if kind_end != -1 else None
+                    pattern = _INIT_PATTERNS.get(kind)
+                    if pattern:
+                        m = pattern.match(line, kind_end)
+
+                if m:
+                    handlers[kind](m)
                 else:
                     print(f"Warning: Unmatched init line: {line}")
 
-        # Link temporary shelf/order data and ensure defaults
+        # Link temporary shelf/order data; products a shelf or order doesn't mention are simply absent
         for shelf_id, quantities in shelf_quantities_temp.items():
             if shelf_id in state['shelves']:
                 state['shelves'][shelf_id]['quantities'] = quantities
@@ -111,13 +153,8 @@ def parse_init(filepath):
             else:
                  print(f"Warning: Order lines defined for order without picking station: {order_id}")
 
-        for shelf_id in state['shelves']:
-            for product_id in state['products']:
-                state['shelves'][shelf_id]['quantities'].setdefault(product_id, 0)
-        
-        for order_id in state['orders']:
-             for product_id in state['products']:
-                 state['orders'][order_id]['requirements'].setdefault(product_id, 0)
+        state['shelf_at'] = index_positions(state['shelves'], first_wins=True)
+        state['robots_at'] = index_positions(state['robots'])
 
     except FileNotFoundError:
         print(f"Error: Input file not found at {filepath}")
@@ -126,51 +163,94 @@ def parse_init(filepath):
         print(f"Error parsing init file {filepath}: {e}")
         return None, None
 
+    max_x = max((x for x, _ in state['nodes']), default=0)
+    max_y = max((y for _, y in state['nodes']), default=0)
     grid_dims = {'x': max_x, 'y': max_y}
     return state, grid_dims
 
+_MOVE_RE = re.compile(r"move\((-?\d+),(-?\d+)\)")
+_DELIVER_RE = re.compile(r"deliver\((\w+),(\w+),(\d+)\)")
+
 def parse_action_string(action_str):
     """ Parses the action component string from an occurs/3 atom """
     action_str = action_str.strip()
 
-    match_move = re.match(r"move\((-?\d+),(-?\d+)\)", action_str)
-    match_pickup = (action_str == "pickup")
-    match_putdown = (action_str == "putdown")
-    match_deliver = re.match(r"deliver\((\w+),(\w+),(\d+)\)", action_str)
-
-    if match_move:
-        dx, dy = map(int, match_move.groups())
-        return {"type": "move", "dx": dx, "dy": dy}
-    elif match_pickup:
+    # Cheap string tests pick the single pattern worth running
+    if action_str == "pickup":
         return {"type": "pickup"}
-    elif match_putdown:
+    if action_str == "putdown":
         return {"type": "putdown"}
-    elif match_deliver:
-        order_id, product_id, units = match_deliver.groups()
-        return {"type": "deliver", "order": order_id, "product": product_id, "units": int(units)}
+    if action_str.startswith("move("):
+        match_move = _MOVE_RE.match(action_str)
+        if match_move:
+            dx, dy = map(int, match_move.groups())
+            return {"type": "move", "dx": dx, "dy": dy}
+    elif action_str.startswith("deliver("):
+        match_deliver = _DELIVER_RE.match(action_str)
+        if match_deliver:
+            order_id, product_id, units = match_deliver.groups()
+            return {"type": "deliver", "order": order_id, "product": product_id, "units": int(units)}
+
+    print(f"Warning: Could not parse action string: {action_str}")
+    return {"type": "unknown", "raw": action_str}
+
+class _SkipCommentLines:
+    """ Minimal binary reader that drops the // comment lines clingo sometimes adds. """
+    def __init__(self, f):
+        self._lines = (line for line in f if not line.lstrip().startswith(b'//'))
+
+    def read(self, size=-1):
+        if size == 0: # ijson probes the stream type with read(0)
+            return b''
+        return next(self._lines, b'')
+
+_COMMENT_LINE_RE = re.compile(rb'(?m)^[ \t]*//.*$')
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+_WITNESS_VALUE_PREFIX = 'Call.item.Witnesses.item.Value'
+
+def iter_plan_atoms(filepath):
+    """
+    Yields the atom strings of the first witness in Clingo's JSON output.
+    Streams the file with ijson when available, so the document is never held in memory.
+    """
+    found_witness = False
+    if ijson is not None:
+        with open(filepath, 'rb') as f:
+            for prefix, event, value in ijson.parse(_SkipCommentLines(f)):
+                if prefix == _WITNESS_VALUE_PREFIX + '.item':
+                    yield value
+                elif prefix == _WITNESS_VALUE_PREFIX:
+                    if event == 'end_array':
+                        return # Only the first witness is visualized
+                    found_witness = True
     else:
-        print(f"Warning: Could not parse action string: {action_str}")
-        return {"type": "unknown", "raw": action_str}
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        try:
+            data = _json_loads(content)
+        except json.JSONDecodeError: # orjson's error subclasses it too
+            # Only pay for comment stripping when the document doesn't parse as-is
+            data = _json_loads(_COMMENT_LINE_RE.sub(b'', content))
+        if data.get('Call') and data['Call'][0].get('Witnesses'):
+            found_witness = True
+            yield from data['Call'][0]['Witnesses'][0].get('Value', [])
+
+    if not found_witness:
+        print("Warning: JSON structure doesn't contain expected 'Call'/'Witnesses'. No plan found?")
+
+_OCCURS_RE = re.compile(r"occurs\(object\(robot,\s*(\w+)\),\s*(.+)\s*,\s*(\d+)\)")
+
+_JSON_ERRORS = (json.JSONDecodeError, ijson.JSONError) if ijson is not None else (json.JSONDecodeError,)
 
 def parse_plan(filepath):
     """ Parses the plan from Clingo's JSON output file. """
     plan = defaultdict(list) 
     max_time = 0
     try:
-        # Read file potentially skipping // comments sometimes added by clingo
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = "".join(line for line in f if not line.strip().startswith('//'))
-        data = json.loads(content)
-
-        if not data.get('Call') or not data['Call'][0].get('Witnesses'):
-            print("Warning: JSON structure doesn't contain expected 'Call'/'Witnesses'. No plan found?")
-            return plan, max_time
-
-        witness = data['Call'][0]['Witnesses'][0]
-        plan_atoms = witness.get('Value', [])
-
-        for atom_str in plan_atoms:
-            match = re.match(r"occurs\(object\(robot,\s*(\w+)\),\s*(.+)\s*,\s*(\d+)\)", atom_str)
+        for atom_str in iter_plan_atoms(filepath):
+            match = _OCCURS_RE.match(atom_str)
             if match:
                 robot_id, action_part, time_str = match.groups()
                 time = int(time_str)
@@ -182,7 +262,7 @@ def parse_plan(filepath):
     except FileNotFoundError:
         print(f"Error: Plan file not found at {filepath}")
         return None, 0
-    except json.JSONDecodeError as e:
+    except _JSON_ERRORS as e:
         print(f"Error: Could not decode JSON from plan file {filepath}. {e}")
         return None, 0
     except Exception as e:
@@ -193,17 +273,85 @@ def parse_plan(filepath):
 
 # --- State Update Logic ---
 
+def index_positions(objects, first_wins=False):
+    """
+    Maps each occupied (x, y) to an object id found there. When objects collide the
+    last one in dict order wins, matching what the grid draws; first_wins keeps the
+    first one instead, which is the shelf a pickup at that cell takes.
+    """
+    index = {}
+    for object_id, data in objects.items():
+        if 'pos' in data:
+            if first_wins:
+                index.setdefault(data['pos'], object_id)
+            else:
+                index[data['pos']] = object_id
+    return index
+
+def copy_state(state):
+    """ Copies the containers apply_actions writes to; shelves and orders stay shared. """
+    next_state = dict(state)
+    next_state['robots'] = {rid: dict(rdata) for rid, rdata in state['robots'].items()}
+    next_state['shelves'] = dict(state['shelves'])
+    next_state['orders'] = dict(state['orders'])
+    next_state['shelf_at'] = dict(state['shelf_at'])
+    return next_state
+
 def update_state(current_state, actions_at_this_step):
     """
     Calculates the next state based on the current state and actions performed.
-    Returns the new state dictionary.
+    Returns the new state dictionary. Unchanged shelves and orders are shared with
+    current_state, so neither state may be mutated in place afterwards.
+    """
+    next_state = copy_state(current_state)
+    apply_actions(current_state, next_state, actions_at_this_step)
+    # Robots may swap cells within a step, so re-index once all moves are applied
+    next_state['robots_at'] = index_positions(next_state['robots'])
+    return next_state
+
+def simulate(initial_state, actions_per_step):
+    """
+    Runs the whole plan and returns the final state without materializing the
+    intermediate ones. actions_per_step[t] holds the actions of time step t (index 0
+    is the initial state). All steps are applied to a single working copy, which skips
+    the per-step container copies update_state needs to keep every state intact.
+    Produces the same final state as folding update_state over the steps.
+    """
+    state = copy_state(initial_state)
+    robots = state['robots']
+    for actions_now in actions_per_step[1:]:
+        if not actions_now:
+            continue
+        # apply_actions reads robot records and shelf_at as they were before the step, so
+        # snapshot just those: the acting robots, and shelf_at only when a pickup reads it
+        before = dict(state)
+        before['robots'] = {a['robot']: dict(robots[a['robot']]) for a in actions_now if a['robot'] in robots}
+        if any(a['action']['type'] == 'pickup' for a in actions_now):
+            before['shelf_at'] = dict(state['shelf_at'])
+        apply_actions(before, state, actions_now)
+    state['robots_at'] = index_positions(state['robots'])
+    return state
+
+def apply_actions(current_state, next_state, actions_at_this_step):
+    """
+    Applies one time step's actions, reading positions from current_state and
+    writing results into next_state. Both may be the same dictionary.
     """
-    next_state = copy.deepcopy(current_state) 
+    # Bind the tables once; the loop body only does single lookups on them
+    robots_curr = current_state['robots']
+    robots_next = next_state['robots']
+    shelf_at_curr = current_state['shelf_at']
+    shelf_at_next = next_state['shelf_at']
+    shelves = next_state['shelves']
+    orders = next_state['orders']
+    highways = next_state.get('highways', set())
+    picking_stations = next_state['picking_stations']
 
     for action_info in actions_at_this_step:
         robot_id = action_info['robot']
         action = action_info['action']
-        robot_curr_state = current_state['robots'].get(robot_id)
+        action_type = action['type']
+        robot_curr_state = robots_curr.get(robot_id)
 
         if not robot_curr_state:
             print(f"Warning: Action specified for unknown robot {robot_id}. Skipping.")
@@ -211,54 +359,52 @@ def update_state(current_state, actions_at_this_step):
 
         current_pos = robot_curr_state['pos']
         current_carrying = robot_curr_state['carries']
-        robot_next_state = next_state['robots'][robot_id] 
+        robot_next_state = robots_next[robot_id] 
 
-        if action['type'] == 'move':
-            next_x = current_pos[0] + action['dx']
-            next_y = current_pos[1] + action['dy']
-            robot_next_state['pos'] = (next_x, next_y)
+        if action_type == 'move':
+            robot_next_state['pos'] = (current_pos[0] + action['dx'], current_pos[1] + action['dy'])
 
-        elif action['type'] == 'pickup':
+        elif action_type == 'pickup':
             if current_carrying:
                 print(f"Warning: Robot {robot_id} tried to pickup while already carrying {current_carrying}. Ignoring pickup.")
                 continue
             
-            shelf_to_pickup = None
-            for shelf_id, shelf_data in current_state['shelves'].items():
-                if shelf_data.get('pos') == current_pos: 
-                    shelf_to_pickup = shelf_id
-                    break
+            shelf_to_pickup = shelf_at_curr.get(current_pos)
             
             if shelf_to_pickup:
                 robot_next_state['carries'] = shelf_to_pickup
-                if shelf_to_pickup in next_state['shelves']:
-                     next_state['shelves'][shelf_to_pickup].pop('pos', None) 
+                shelf_at_next.pop(current_pos, None)
+                shelf = shelves.get(shelf_to_pickup)
+                if shelf is not None:
+                     shelf_next = dict(shelf)
+                     shelf_next.pop('pos', None)
+                     shelves[shelf_to_pickup] = shelf_next
             else:
                 print(f"Warning: Robot {robot_id} tried to pickup at {current_pos}, but no shelf found there. Ignoring pickup.")
 
-        elif action['type'] == 'putdown':
+        elif action_type == 'putdown':
             if not current_carrying:
                 print(f"Warning: Robot {robot_id} tried to putdown while carrying nothing. Ignoring putdown.")
                 continue
             
-            if current_pos in next_state.get('highways', set()):
+            if current_pos in highways:
                  print(f"Warning: Robot {robot_id} tried to putdown shelf {current_carrying} on highway {current_pos}. Ignoring.")
                  continue
 
-            occupied = False
-            for shelf_id, shelf_data in next_state['shelves'].items():
-                 if shelf_data.get('pos') == current_pos and shelf_id != current_carrying:
-                     print(f"Warning: Robot {robot_id} tried to putdown shelf {current_carrying} at {current_pos}, but shelf {shelf_id} is already there. Ignoring.")
-                     occupied = True
-                     break
-            if occupied: continue
+            shelf_id = shelf_at_next.get(current_pos)
+            if shelf_id is not None and shelf_id != current_carrying:
+                 print(f"Warning: Robot {robot_id} tried to putdown shelf {current_carrying} at {current_pos}, but shelf {shelf_id} is already there. Ignoring.")
+                 continue
 
-            shelf_id_being_carried = current_carrying
             robot_next_state['carries'] = None
-            if shelf_id_being_carried in next_state['shelves']:
-                next_state['shelves'][shelf_id_being_carried]['pos'] = current_pos
-
-        elif action['type'] == 'deliver':
+            shelf = shelves.get(current_carrying)
+            if shelf is not None:
+                shelf_next = dict(shelf)
+                shelf_next['pos'] = current_pos
+                shelves[current_carrying] = shelf_next
+                shelf_at_next[current_pos] = current_carrying
+
+        elif action_type == 'deliver':
             shelf_id_carried = current_carrying
             order_id = action['order']
             product_id = action['product']
@@ -267,192 +413,190 @@ def update_state(current_state, actions_at_this_step):
             if not shelf_id_carried:
                 print(f"Warning: Robot {robot_id} tried to deliver while carrying nothing. Ignoring.")
                 continue
-            if shelf_id_carried not in next_state['shelves']:
+            shelf = shelves.get(shelf_id_carried)
+            if shelf is None:
                 print(f"Warning: Robot {robot_id} carrying unknown shelf {shelf_id_carried}. Ignoring deliver.")
                 continue
-            if order_id not in next_state['orders']:
+            order = orders.get(order_id)
+            if order is None:
                  print(f"Warning: Deliver action for unknown order {order_id}. Ignoring.")
                  continue
-            
-            # Check if product exists on shelf (even if 0 quantity) before trying to access quantities dict further
-            if product_id not in next_state['shelves'][shelf_id_carried].get('quantities', {}):
-                 print(f"Warning: Deliver action for unknown product {product_id} on shelf {shelf_id_carried}. Ignoring.")
-                 continue
 
-            required_station_id = next_state['orders'][order_id].get('station_id')
-            required_station_pos = next_state['picking_stations'].get(required_station_id) if required_station_id else None
+            required_station_id = order.get('station_id')
+            required_station_pos = picking_stations.get(required_station_id) if required_station_id else None
             if current_pos != required_station_pos:
                 print(f"Warning: Robot {robot_id} tried to deliver for order {order_id} at {current_pos}, but required station {required_station_id} is at {required_station_pos}. Ignoring.")
                 continue
 
-            current_shelf_qty = next_state['shelves'][shelf_id_carried]['quantities'].get(product_id, 0)
+            # Absent products count as zero, which also rejects products the shelf never held
+            current_shelf_qty = shelf['quantities'].get(product_id, 0)
             if current_shelf_qty < units:
                 print(f"Warning: Robot {robot_id} tried to deliver {units} of {product_id} from shelf {shelf_id_carried}, but it only has {current_shelf_qty}. Ignoring.")
                 continue
                 
-            next_state['shelves'][shelf_id_carried]['quantities'][product_id] -= units
-            # Ensure requirements exist before decrementing
-            if product_id in next_state['orders'][order_id].get('requirements', {}):
-                 next_state['orders'][order_id]['requirements'][product_id] -= units
-                 if next_state['orders'][order_id]['requirements'][product_id] < 0:
-                      next_state['orders'][order_id]['requirements'][product_id] = 0
-            else:
-                 print(f"Warning: Tried to decrement requirement for product {product_id} not in order {order_id}.")
-
-    return next_state
+            # Copy only the shelf and order touched by this delivery
+            shelf_next = dict(shelf)
+            shelf_q = shelf_next['quantities'] = dict(shelf['quantities'])
+            shelf_q[product_id] = current_shelf_qty - units
+            shelves[shelf_id_carried] = shelf_next
+            # Products the order never asked for have nothing left to fulfil
+            order_req = order['requirements']
+            if product_id in order_req:
+                 order_next = dict(order)
+                 order_req = order_next['requirements'] = dict(order_req)
+                 order_req[product_id] = max(0, order_req[product_id] - units)
+                 orders[order_id] = order_next
 
 # --- Visualization ---
 
-def calculate_max_width_for_state(state, grid_dims):
-    """Calculates the maximum cell width needed to display the given state."""
-    max_w = 0
-    for r in range(1, grid_dims['y'] + 1):
-         for c in range(1, grid_dims['x'] + 1):
-              content = " " 
-              pos = (c, r)
-              
-              robot_here = None
-              shelf_here = None
-              for rid, rdata in state.get('robots', {}).items():
-                  if rdata.get('pos') == pos: robot_here = rid; break 
-              for sid, sdata in state.get('shelves', {}).items():
-                   if sdata.get('pos') == pos: shelf_here = sid; break 
-              
-              if robot_here:
-                  carried = state['robots'][robot_here].get('carries')
-                  content = f"{GRID_SYMBOLS['robot']}{robot_here}"
-                  if carried: content += f"{GRID_SYMBOLS['robot_shelf_prefix']}{GRID_SYMBOLS['shelf']}{carried}{GRID_SYMBOLS['robot_shelf_suffix']}"
-              elif shelf_here: 
-                  content = f"{GRID_SYMBOLS['shelf']}{shelf_here}"
-              else:
-                  # Check static background
-                  station_match = False
-                  for station_id, station_pos in state.get('picking_stations', {}).items():
-                       if station_pos == pos:
-                           content = f"{GRID_SYMBOLS['station']}{station_id}"
-                           station_match = True
-                           break
-                  if not station_match:
-                      if pos in state.get('highways', set()): content = GRID_SYMBOLS['highway']
-                      elif pos in state.get('nodes', set()): content = GRID_SYMBOLS['empty']
-              
-              max_w = max(max_w, len(content.strip())) 
-              
-    return max(max_w, 1) 
-
-def visualize_step(state, time, grid_dims, fixed_cell_width, actions_this_step=None): 
+def calculate_max_cell_width(state):
+    """
+    Returns the widest cell content any state reachable from this one can need.
+    Cell contents depend only on object ids, so this is computed from the ids alone
+    rather than by simulating the plan: the widest cell is a robot carrying a shelf.
+    """
+    max_rid = max((len(rid) for rid in state.get('robots', {})), default=0)
+    max_sid = max((len(sid) for sid in state.get('shelves', {})), default=0)
+    max_stn = max((len(stn) for stn in state.get('picking_stations', {})), default=0)
+
+    widths = [1] # highway / empty node symbols
+    if max_rid:
+        robot_w = len(GRID_SYMBOLS['robot']) + max_rid
+        if max_sid:
+            robot_w += len(GRID_SYMBOLS['robot_shelf_prefix']) + len(GRID_SYMBOLS['shelf']) + max_sid + len(GRID_SYMBOLS['robot_shelf_suffix'])
+        widths.append(robot_w)
+    if max_sid: widths.append(len(GRID_SYMBOLS['shelf']) + max_sid)
+    if max_stn: widths.append(len(GRID_SYMBOLS['station']) + max_stn)
+    return max(widths)
+
+@functools.lru_cache(maxsize=None)
+def grid_borders(cols, cell_width):
+    """ Returns the (top, middle, bottom) separator lines for a grid; invariant across frames. """
+    # Define box-drawing characters
+    row_separator_joint = "┼"
+    row_separator_segment = "─" * cell_width
+    top_joint_left = "┌"
+    top_joint_right = "┐"
+    top_joint_middle = "┬"
+    mid_joint_left = "├"
+    mid_joint_right = "┤"
+    bottom_joint_left = "└"
+    bottom_joint_right = "┘"
+    bottom_joint_middle = "┴"
+
+    # Construct separator strings
+    top_border = top_joint_left + (row_separator_segment + top_joint_middle) * (cols - 1) + row_separator_segment + top_joint_right
+    mid_separator = mid_joint_left + (row_separator_segment + row_separator_joint) * (cols - 1) + row_separator_segment + mid_joint_right
+    bottom_border = bottom_joint_left + (row_separator_segment + bottom_joint_middle) * (cols - 1) + row_separator_segment + bottom_joint_right
+    return top_border, mid_separator, bottom_border
+
+def build_static_cells(state, grid_dims):
+    """
+    Builds the flat background grid (nodes, highways, picking stations), which never
+    changes over time. Cell (x, y) lives at cells[y * (grid_dims['x'] + 1) + x], 1-based.
+    """
+    cols, rows = grid_dims['x'], grid_dims['y']
+    stride = cols + 1
+    cells = [" "] * (stride * (rows + 1))
+
+    def place(pos, content):
+        x, y = pos
+        if 1 <= y <= rows and 1 <= x <= cols:
+            cells[y * stride + x] = content
+
+    for pos in state.get('nodes', ()): place(pos, GRID_SYMBOLS['empty'])
+    for pos in state.get('highways', ()): place(pos, GRID_SYMBOLS['highway'])
+    for station_id, pos in state.get('picking_stations', {}).items():
+        place(pos, f"{GRID_SYMBOLS['station']}{station_id}")
+    return cells
+
+def visualize_step(state, time, grid_dims, fixed_cell_width, actions_this_step=None, static_cells=None): 
     """
     Prints a textual representation of the warehouse state at a given time.
     Uses a pre-calculated fixed_cell_width for consistent formatting.
+    static_cells is the background from build_static_cells; it is rebuilt if omitted.
     Assumes coordinates are 1-based for display. (0,0) top-left.
     """
     if actions_this_step is None: actions_this_step = []
+    if static_cells is None: static_cells = build_static_cells(state, grid_dims)
 
-    # Initialize internal 0-indexed grids
-    grid = [[" " for _ in range(grid_dims['x'] + 1)] for _ in range(grid_dims['y'] + 1)]
-    display_layer = [[" " for _ in range(grid_dims['x'] + 1)] for _ in range(grid_dims['y'] + 1)]
-    final_grid = [[" " for _ in range(grid_dims['x'] + 1)] for _ in range(grid_dims['y'] + 1)]
+    cols_to_display = grid_dims['x']
+    rows_to_display = grid_dims['y']
+    stride = cols_to_display + 1
 
-    # Populate internal grids using 1-based coordinates
-    for r in range(1, grid_dims['y'] + 1): 
-        for c in range(1, grid_dims['x'] + 1): 
-             pos = (c, r)
-             if pos in state.get('nodes', set()): grid[r][c] = GRID_SYMBOLS['empty']
-             if pos in state.get('highways', set()): grid[r][c] = GRID_SYMBOLS['highway']
+    # Shelves and robots are overlaid on a copy of the background
+    cells = static_cells[:]
 
-    for station_id, pos in state.get('picking_stations', {}).items():
+    def place(pos, content):
         x, y = pos
-        if 1 <= y <= grid_dims['y'] and 1 <= x <= grid_dims['x']:
-           grid[y][x] = f"{GRID_SYMBOLS['station']}{station_id}"
+        if 1 <= y <= rows_to_display and 1 <= x <= cols_to_display:
+            cells[y * stride + x] = content
 
+    # Drawn from the shelf table rather than shelf_at so that, on a collision, the
+    # last shelf is shown like the robots (shelf_at keeps the first one for pickups)
     for shelf_id, shelf_data in state.get('shelves', {}).items():
         if 'pos' in shelf_data:
-            x, y = shelf_data['pos']
-            if 1 <= y <= grid_dims['y'] and 1 <= x <= grid_dims['x']:
-                display_layer[y][x] = f"{GRID_SYMBOLS['shelf']}{shelf_id}"
-
-    for robot_id, robot_data in state.get('robots', {}).items():
-        x, y = robot_data.get('pos', (-1,-1))
-        if 1 <= y <= grid_dims['y'] and 1 <= x <= grid_dims['x']:
-            carried_shelf = robot_data.get('carries')
-            content = f"{GRID_SYMBOLS['robot']}{robot_id}"
-            if carried_shelf:
-                 content += f"{GRID_SYMBOLS['robot_shelf_prefix']}{GRID_SYMBOLS['shelf']}{carried_shelf}{GRID_SYMBOLS['robot_shelf_suffix']}"
-            display_layer[y][x] = content
-
-    # Combine layers into final_grid
-    for r in range(1, grid_dims['y'] + 1): 
-         for c in range(1, grid_dims['x'] + 1): 
-              if display_layer[r][c] != " ": final_grid[r][c] = display_layer[r][c]
-              else: final_grid[r][c] = grid[r][c]
-
-    # Clear screen and move cursor to home position
-    print(CLEAR_SCREEN + CURSOR_HOME, end='')
+            place(shelf_data['pos'], f"{GRID_SYMBOLS['shelf']}{shelf_id}")
 
-    # --- Grid Printing ---
-    print(f"--- Time: {time} ---")
-    cols_to_display = grid_dims['x']
-    max_cell_width = fixed_cell_width 
+    for pos, robot_id in state.get('robots_at', {}).items():
+        carried_shelf = state['robots'][robot_id].get('carries')
+        content = f"{GRID_SYMBOLS['robot']}{robot_id}"
+        if carried_shelf:
+             content += f"{GRID_SYMBOLS['robot_shelf_prefix']}{GRID_SYMBOLS['shelf']}{carried_shelf}{GRID_SYMBOLS['robot_shelf_suffix']}"
+        place(pos, content)
 
-    # Define box-drawing characters
+    # The frame is collected line by line and written in one go
+    max_cell_width = fixed_cell_width 
     cell_separator = "│"
-    row_separator_joint = "┼"
-    row_separator_segment = "─" * max_cell_width
-    top_joint_left = "┌"
-    top_joint_right = "┐"
-    top_joint_middle = "┬"
-    mid_joint_left = "├"
-    mid_joint_right = "┤"
-    bottom_joint_left = "└"
-    bottom_joint_right = "┘"
-    bottom_joint_middle = "┴"
+    top_border, mid_separator, bottom_border = grid_borders(cols_to_display, max_cell_width)
 
-    # Construct separator strings
-    top_border = top_joint_left + (row_separator_segment + top_joint_middle) * (cols_to_display - 1) + row_separator_segment + top_joint_right
-    mid_separator = mid_joint_left + (row_separator_segment + row_separator_joint) * (cols_to_display - 1) + row_separator_segment + mid_joint_right
-    bottom_border = bottom_joint_left + (row_separator_segment + bottom_joint_middle) * (cols_to_display - 1) + row_separator_segment + bottom_joint_right
-
-    print(top_border)
-    for r in range(1, grid_dims['y'] + 1): 
-        cells_to_print = [final_grid[r][c].ljust(max_cell_width) for c in range(1, grid_dims['x'] + 1)] 
-        row_content = cell_separator + cell_separator.join(cells_to_print) + cell_separator
-        print(row_content)
-        if r < grid_dims['y']: print(mid_separator)
-        else: print(bottom_border)
+    out = [f"--- Time: {time} ---"]
+
+    # --- Grid Printing ---
+    out.append(top_border)
+    for r in range(1, rows_to_display + 1): 
+        out.append(cell_separator + cell_separator.join(cell.ljust(max_cell_width) for cell in cells[r * stride + 1:(r + 1) * stride]) + cell_separator)
+        out.append(mid_separator if r < rows_to_display else bottom_border)
 
     # --- Action & Summary Printing ---
     if actions_this_step:
-        print("Actions Occurring:")
+        out.append("Actions Occurring:")
         for action_info in actions_this_step:
             robot_id = action_info['robot']
             action = action_info['action']
             action_str = f"  Robot {robot_id}: {action['type']}"
             if action['type'] == 'move': action_str += f" ({action['dx']},{action['dy']})"
             elif action['type'] == 'deliver': action_str += f" (Order: {action['order']}, Product: {action['product']}, Units: {action['units']})"
-            print(action_str)
+            out.append(action_str)
     elif time > 0: 
-        print("No actions occurred.")
-
-    print("\nShelf Quantities:")
-    shelf_summary_printed = False
-    shelves_exist = bool(state.get('shelves'))
-    if shelves_exist:
-        for sid, sdata in sorted(state.get('shelves', {}).items()):
-            qtys = [f"Product {pid}: Qty {qty}" for pid, qty in sorted(sdata.get('quantities', {}).items()) if qty > 0]
-            if qtys: print(f"  Shelf {sid}: {', '.join(qtys)}"); shelf_summary_printed = True
-        if not shelf_summary_printed: print("  All shelves appear empty.")
-    else: print("  No shelves defined.")
-        
-    print("\nOrder Requirements:")
-    any_unfulfilled_orders = False 
-    orders_defined = bool(state.get('orders')) 
-    if not orders_defined:
-        print("  No orders defined in the input.")
+        out.append("No actions occurred.")
+
+    shelves = state.get('shelves', {})
+    out.append("")
+    out.append("Shelf Quantities:")
+    if not shelves:
+        out.append("  No shelves defined.")
+    else:
+        shelf_qtys = ((sid, [f"Product {pid}: Qty {qty}" for pid, qty in sorted(sdata.get('quantities', {}).items()) if qty > 0])
+                      for sid, sdata in sorted(shelves.items()))
+        out.extend([f"  Shelf {sid}: {', '.join(qtys)}" for sid, qtys in shelf_qtys if qtys] or ["  All shelves appear empty."])
+
+    orders = state.get('orders', {})
+    out.append("")
+    out.append("Order Requirements:")
+    if not orders:
+        out.append("  No orders defined in the input.")
     else:
-        for oid, odata in sorted(state.get('orders', {}).items()):
-            reqs = [f"Product {pid}: Qty {qty}" for pid, qty in sorted(odata.get('requirements', {}).items()) if qty > 0]
-            if reqs: print(f"  Order {oid} (at {GRID_SYMBOLS['station']}{odata.get('station_id','?')}) Req: {', '.join(reqs)}"); any_unfulfilled_orders = True 
-        if not any_unfulfilled_orders: print("  All defined orders fulfilled!")
+        order_reqs = ((oid, odata, [f"Product {pid}: Qty {qty}" for pid, qty in sorted(odata.get('requirements', {}).items()) if qty > 0])
+                      for oid, odata in sorted(orders.items()))
+        out.extend([f"  Order {oid} (at {GRID_SYMBOLS['station']}{odata.get('station_id','?')}) Req: {', '.join(reqs)}"
+                    for oid, odata, reqs in order_reqs if reqs] or ["  All defined orders fulfilled!"])
+
+    # Redraw in place from the top-left: each line clears its stale tail, and
+    # anything left below a shorter frame is cleared at the end
+    out.append("")
+    sys.stdout.write(CURSOR_HOME + (CLEAR_LINE + "\n").join(out) + CLEAR_TO_END)
+    sys.stdout.flush()
 
 # --- Main Execution ---
 
@@ -461,7 +605,12 @@ if __name__ == "__main__":
     parser.add_argument("init_file", help="Path to the input file (.lp) with init facts.")
     parser.add_argument("plan_file", help="Path to the plan file (.json) from Clingo.")
     parser.add_argument("--delay", type=float, default=0.5, help="Delay in seconds between steps (default: 0.5).")
+    render_mode = parser.add_mutually_exclusive_group()
+    render_mode.add_argument("--headless", "--no-render", action="store_true", help="Simulate without rendering frames and print only the final summary (implied when stdout is not a terminal).")
+    render_mode.add_argument("--render", action="store_true", help="Render frames even when stdout is not a terminal, e.g. when redirecting to a file or piping to less -R.")
     args = parser.parse_args()
+    if not args.render and not sys.stdout.isatty():
+        args.headless = True
 
     # Enable ANSI escape sequences for Windows
     if os.name == 'nt':
@@ -472,42 +621,35 @@ if __name__ == "__main__":
 
     plan, max_time = parse_plan(args.plan_file)
     if plan is None: exit(1)
+    actions_per_step = [plan.get(t, ()) for t in range(max_time + 1)]
+
+    if args.headless:
+        # No frames to draw, so intermediate states are never needed
+        current_state = simulate(initial_state, actions_per_step)
+    else:
+        overall_max_cell_width = calculate_max_cell_width(initial_state)
+        print(f"Fixed cell width for visualization: {overall_max_cell_width}")
+        static_cells = build_static_cells(initial_state, grid_dims)
+
+        # Visualization Loop
+        current_state = initial_state 
+        print("\nStarting Visualization...")
+        print(CLEAR_SCREEN, end='') # Once; frames then redraw over each other from the cursor home
+        visualize_step(current_state, 0, grid_dims, overall_max_cell_width, static_cells=static_cells) 
+        time.sleep(args.delay * 2) 
+
+        for t, actions_now in enumerate(actions_per_step[1:], start=1):
+            current_state = update_state(current_state, actions_now) 
+            visualize_step(current_state, t, grid_dims, overall_max_cell_width, actions_now, static_cells) 
+            time.sleep(args.delay)
 
-    # Pre-simulation Pass
-    print("Pre-calculating maximum cell width for consistent grid size...")
-    overall_max_cell_width = 0
-    temp_state = copy.deepcopy(initial_state) 
-    overall_max_cell_width = max(overall_max_cell_width, calculate_max_width_for_state(temp_state, grid_dims))
-
-    for t in range(1, max_time + 1):
-        temp_state = update_state(temp_state, plan.get(t, [])) 
-        overall_max_cell_width = max(overall_max_cell_width, calculate_max_width_for_state(temp_state, grid_dims))
-    print(f"Calculation complete. Fixed cell width for visualization: {overall_max_cell_width}")
-
-    # Visualization Loop
-    current_state = initial_state 
-    print("\nStarting Visualization...")
-    visualize_step(current_state, 0, grid_dims, overall_max_cell_width) 
-    time.sleep(args.delay * 2) 
-
-    for t in range(1, max_time + 1):
-        actions_now = plan.get(t, [])
-        current_state = update_state(current_state, actions_now) 
-        visualize_step(current_state, t, grid_dims, overall_max_cell_width, actions_now) 
-        time.sleep(args.delay)
-
-    print(f"\n--- Simulation Complete (Reached Time {max_time}) ---")
-    
     # Final Summary
-    print("\nFinal Order Requirements:")
-    all_fulfilled = True
-    orders_exist_final = bool(current_state.get('orders'))
-    if not orders_exist_final: 
-        print("  No orders defined.")
+    orders = current_state.get('orders', {})
+    if not orders:
+        summary = ["  No orders defined."]
     else:
-        for oid, odata in sorted(current_state.get('orders', {}).items()):
-            reqs = [f"P{pid}:{qty}" for pid, qty in sorted(odata.get('requirements', {}).items()) if qty > 0]
-            if reqs: 
-                print(f"  Order {oid} (at {GRID_SYMBOLS['station']}{odata.get('station_id','?')}) Req: {', '.join(reqs)} --> NOT FULFILLED")
-                all_fulfilled = False
-        if all_fulfilled: print("  All defined orders fulfilled!")
\ No newline at end of file
+        order_reqs = ((oid, odata, [f"P{pid}:{qty}" for pid, qty in sorted(odata.get('requirements', {}).items()) if qty > 0])
+                      for oid, odata in sorted(orders.items()))
+        summary = [f"  Order {oid} (at {GRID_SYMBOLS['station']}{odata.get('station_id','?')}) Req: {', '.join(reqs)} --> NOT FULFILLED"
+                   for oid, odata, reqs in order_reqs if reqs] or ["  All defined orders fulfilled!"]
+    sys.stdout.write("\n".join(["", f"--- Simulation Complete (Reached Time {max_time}) ---", "", "Final Order Requirements:", *summary, ""]))